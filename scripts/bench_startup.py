@@ -0,0 +1,84 @@
+"""
+Benchmark de startup: mede (em processos novos, sem cache de import)
+  1. o import do app (o que cada worker do gunicorn paga no boot)
+  2. o init_db com o schema já na versão atual (o que o container paga no CMD)
+
+Uso:
+    python scripts/bench_startup.py [--runs 5]
+
+Sem DATABASE_URL no ambiente, usa um SQLite temporário.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_APP = """
+import sys, time
+t0 = time.perf_counter()
+import src.main
+dt = time.perf_counter() - t0
+pesados = [m for m in ('google.generativeai', 'twilio') if m in sys.modules]
+print(f"{dt:.6f}|{','.join(pesados)}")
+"""
+
+INIT_DB = """
+import time
+t0 = time.perf_counter()
+from src.init_db import init_database
+init_database()
+print(f"{time.perf_counter() - t0:.6f}")
+"""
+
+def rodar(codigo, env):
+    t0 = time.perf_counter()
+    saida = subprocess.run(
+        [sys.executable, '-c', codigo], cwd=RAIZ, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout.strip().splitlines()[-1]
+    return time.perf_counter() - t0, saida
+
+def resumo(nome, tempos):
+    print(f"{nome:<32} mediana {statistics.median(tempos)*1000:8.1f} ms | "
+          f"min {min(tempos)*1000:8.1f} ms | max {max(tempos)*1000:8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=RAIZ, PYTHONDONTWRITEBYTECODE='1')
+    env.setdefault('GEMINI_API_KEY', 'bench')
+    tmp = None
+    if not env.get('DATABASE_URL'):
+        tmp = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        env['DATABASE_URL'] = f"sqlite:///{tmp.name}"
+
+    # Primeiro init aplica as migrações; os próximos devem só checar a versão
+    rodar(INIT_DB, env)
+
+    processo_app, import_app, init_db = [], [], []
+    pesados = ''
+    for _ in range(args.runs):
+        total, saida = rodar(IMPORT_APP, env)
+        dt, pesados = saida.split('|')
+        processo_app.append(total)
+        import_app.append(float(dt))
+        init_db.append(rodar(INIT_DB, env)[0])
+
+    print(f"Runs: {args.runs} | Python {sys.version.split()[0]}")
+    resumo('import src.main', import_app)
+    resumo('processo python + import app', processo_app)
+    resumo('init_db (schema atual)', init_db)
+    print(f"SDKs pesados carregados no boot: {pesados or 'nenhum'}")
+
+    if tmp:
+        os.unlink(tmp.name)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import os
+
+# ==========================================
+# CONFIGURAÇÕES GERAIS (lidas do .env)
+# ==========================================
+
+def env_int(nome, padrao):
+    """Lê uma variável de ambiente inteira, caindo no padrão se vier vazia/errada."""
+    valor = os.getenv(nome)
+    try:
+        return int(valor) if valor not in (None, '') else padrao
+    except ValueError:
+        print(f"⚠️ Valor inválido para {nome}: '{valor}'. Usando {padrao}.")
+        return padrao
+
+def env_bool(nome, padrao=False):
+    valor = os.getenv(nome)
+    if valor in (None, ''):
+        return padrao
+    return valor.strip().lower() in ('1', 'true', 'sim', 'yes', 'on')
+
+# --- CUSTOS DE TOKENS ---
+# Custo fixo (créditos) de um envio manual de atendente
+COST_MESSAGE = 5
+COST_SESSION = 9
+# Respostas do Gemini são cobradas pelo uso real (créditos por 1000 tokens)
+CREDITOS_POR_1K_PROMPT = env_int('CREDITOS_POR_1K_PROMPT', 1)
+CREDITOS_POR_1K_RESPOSTA = env_int('CREDITOS_POR_1K_RESPOSTA', 4)
+# Ledger: grava em lote a cada N registros ou X segundos
+METERING_FLUSH_SIZE = env_int('METERING_FLUSH_SIZE', 50)
+METERING_FLUSH_INTERVAL = env_int('METERING_FLUSH_INTERVAL', 5)
+# Limites do buffer: registros que falham muito ou excedem o tamanho são descartados (com log)
+METERING_MAX_TENTATIVAS = env_int('METERING_MAX_TENTATIVAS', 5)
+METERING_MAX_BUFFER = env_int('METERING_MAX_BUFFER', 5000)
+
+# --- BANCO DE DADOS ---
+DATABASE_URL = os.getenv('DATABASE_URL')
+# Réplica de leitura opcional (views do painel e tools de consulta)
+DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')
+
+# Pool de conexões (por worker do gunicorn)
+DB_POOL_SIZE = env_int('DB_POOL_SIZE', 5)
+DB_MAX_OVERFLOW = env_int('DB_MAX_OVERFLOW', 5)
+DB_POOL_TIMEOUT = env_int('DB_POOL_TIMEOUT', 10)      # segundos esperando conexão livre
+DB_POOL_RECYCLE = env_int('DB_POOL_RECYCLE', 1800)    # recicla conexões antigas (segundos)
+DB_POOL_PRE_PING = env_bool('DB_POOL_PRE_PING', True)
+
+# Timeouts de statement (ms). 0 = sem limite.
+DB_STATEMENT_TIMEOUT_MS = env_int('DB_STATEMENT_TIMEOUT_MS', 0)
+DB_ADMIN_TIMEOUT_MS = env_int('DB_ADMIN_TIMEOUT_MS', 5000)
+# Quanto tempo a réplica fica "de castigo" depois de uma falha (segundos)
+DB_REPLICA_RETRY_SECONDS = env_int('DB_REPLICA_RETRY_SECONDS', 30)
+
+def engine_options(url):
+    """Monta as opções do engine SQLAlchemy (pool, pre-ping e timeout padrão)."""
+    if not url or url.startswith('sqlite'):
+        # SQLite (testes locais) não usa QueuePool
+        return {'pool_pre_ping': DB_POOL_PRE_PING}
+
+    opcoes = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+    if DB_STATEMENT_TIMEOUT_MS > 0 and url.startswith('postgres'):
+        opcoes['connect_args'] = {'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}'}
+    return opcoes
+
+def configurar_banco(app):
+    """Aplica URI, pool e bind da réplica (se existir) no app Flask."""
+    app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(DATABASE_URL)
+    if DATABASE_REPLICA_URL:
+        app.config['SQLALCHEMY_BINDS'] = {
+            'replica': {'url': DATABASE_REPLICA_URL, **engine_options(DATABASE_REPLICA_URL)}
+        }
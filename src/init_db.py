@@ -1,8 +1,16 @@
 import os
+import sys
 from flask import Flask
 from werkzeug.security import generate_password_hash
 from src.models import db, BotConfig, Usuario # Importe o Usuario!
-from src.main import app
+from src.config import configurar_banco, env_bool
+from src.migrations import aplicar_migracoes, schema_atualizado, VERSAO_ATUAL
+
+# App mínimo só com o banco: não importa src.main (Gemini, Twilio, rotas)
+app = Flask(__name__)
+configurar_banco(app)
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+db.init_app(app)
 
 def carregar_texto_prompt():
     """Lê o arquivo de texto externo para não sujar o código Python"""
@@ -19,13 +27,27 @@ def carregar_texto_prompt():
         print(f"❌ Erro ao ler arquivo de prompt: {e}")
         return "Erro ao carregar personalidade."
 
-def init_database():
+def init_database(forcar=False):
     print("🔄 Verificando Banco de Dados...")
     with app.app_context():
+        # Migração com erro NÃO pode seguir pro gunicorn com schema pela metade:
+        # sai com código 1 e o '&&' do CMD do Docker segura a subida do app.
+        try:
+            # Schema já na última versão: não mexe em nada (boot rápido).
+            # Para re-sincronizar prompt/admin: FORCAR_INIT_DB=true ou --force
+            if not forcar and schema_atualizado():
+                print(f"⚡ Schema já está na versão {VERSAO_ATUAL}. Pulando init.")
+                return
+
+            # Cria/atualiza as tabelas via migrações versionadas
+            aplicadas = aplicar_migracoes()
+            if aplicadas:
+                print(f"🧱 Migrações aplicadas: {aplicadas}")
+        except Exception as e:
+            print(f"❌ Falha nas migrações do banco: {e}")
+            sys.exit(1)
+
         try:
-            # Cria todas as tabelas (BotConfig, Cliente, Mensagem, Produto, USUARIO)
-            db.create_all()
-            
             # =========================================
             # 1. CONFIGURAÇÃO DO BOT (Prompt)
             # =========================================
@@ -83,4 +105,4 @@ def init_database():
             print(f"❌ Erro crítico no init_db: {e}")
 
 if __name__ == "__main__":
-    init_database()
\ No newline at end of file
+    init_database(forcar='--force' in sys.argv or env_bool('FORCAR_INIT_DB'))
@@ -1,15 +1,20 @@
 import os
 from functools import wraps
 from datetime import datetime
-from flask import Flask, request, jsonify, render_template, session, redirect, url_for, flash, Response
+from flask import Flask, request, jsonify, render_template, session, redirect, url_for, flash, Response, stream_with_context
 from werkzeug.security import generate_password_hash, check_password_hash
-from twilio.rest import Client
-from twilio.twiml.messaging_response import MessagingResponse
 import traceback # <--- ADICIONE ISSO AQUI
 import sys
 
 # Imports locais (Garanta que src.models e src.services existem)
 from src.models import db, Cliente, Mensagem, Produto, Usuario, BotConfig
+from src.config import configurar_banco, DB_ADMIN_TIMEOUT_MS, COST_MESSAGE
+from src.services.db_router import somente_leitura, erro_da_replica
+from src.services.assistente_sessoes import resetar_sessao
+from src.services.bulk_service import novo_relatorio, importar_clientes, exportar_clientes, exportar_mensagens
+from src.services.metering import iniciar_metering, registrar_consumo, extrair_uso, saldo_disponivel
+from src.services.tools import consumo_tokens, custo_por_cliente
+from src.services.whatsapp_service import TWIML_VAZIO, enviar_mensagem, twilio_configurado
 from src.services.gemini_service import (
     configurar_gemini, 
     iniciar_modelo, 
@@ -17,20 +22,17 @@ from src.services.gemini_service import (
     processar_assistente_prompt
 )
 
-# CUSTOS DE TOKENS
-COST_MESSAGE = 5  
-COST_SESSION = 9  
-
 app = Flask(__name__)
 
 # --- CONFIGURAÇÕES ---
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
+configurar_banco(app) # URI, pool e réplica (ver src/config.py)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.secret_key = os.getenv('ADMIN_SECRET_TOKEN', 'dev_secret_key')
 
 db.init_app(app)
+iniciar_metering(app) # Ledger de tokens gravado em lote (thread por worker)
 
-# Configura Gemini ao iniciar
+# Valida a chave do Gemini ao iniciar (o SDK só é importado no primeiro uso)
 try:
     configurar_gemini()
 except Exception as e:
@@ -40,24 +42,13 @@ except Exception as e:
 # FUNÇÕES AUXILIARES (TOKENS & AUTH)
 # ==========================================
 
-def verificar_e_consumir_token(quantidade=1):
-    """Verifica e consome tokens do saldo global."""
+def tem_saldo(quantidade=1):
+    """Verifica o saldo global (banco menos o que está no buffer do ledger)."""
     try:
-        config = BotConfig.query.first()
-        if not config:
-            return False
-        
-        if config.saldo_tokens is None:
-            config.saldo_tokens = 0
-            db.session.commit()
+        saldo = saldo_disponivel()
+        if saldo < quantidade:
+            print(f"⚠️ SALDO INSUFICIENTE: Tem {saldo}, precisa de {quantidade}.")
             return False
-
-        if config.saldo_tokens < quantidade:
-            print(f"⚠️ SALDO INSUFICIENTE: Tem {config.saldo_tokens}, precisa de {quantidade}.")
-            return False
-
-        config.saldo_tokens -= quantidade
-        db.session.commit()
         return True
     except Exception as e:
         print(f"❌ Erro ao verificar tokens: {e}")
@@ -89,15 +80,16 @@ def admin_required(f):
 
 @app.route('/', endpoint='dashboard')
 @login_required
+@somente_leitura(timeout_ms=DB_ADMIN_TIMEOUT_MS)
 def index():
     try:
         total_clientes = db.session.query(Cliente).count()
         total_msgs = db.session.query(Mensagem).count()
         total_produtos = db.session.query(Produto).count()
         
-        config = BotConfig.query.first()
-        saldo_tokens = config.saldo_tokens if config and config.saldo_tokens is not None else 0
-    except:
+        saldo_tokens = saldo_disponivel()
+    except Exception as e:
+        if erro_da_replica(e): raise # somente_leitura repete no primário
         total_clientes = total_msgs = total_produtos = saldo_tokens = 0
     
     return render_template('index.html', 
@@ -108,6 +100,7 @@ def index():
 
 @app.route('/chats', endpoint='conversas')
 @login_required
+@somente_leitura(timeout_ms=DB_ADMIN_TIMEOUT_MS)
 def chats_view():
     # Busca clientes que possuem mensagens, ordenados por atividade recente
     clientes_ids = db.session.query(Mensagem.cliente_id).distinct().all()
@@ -118,6 +111,7 @@ def chats_view():
 
 @app.route('/products', endpoint='produtos')
 @login_required
+@somente_leitura(timeout_ms=DB_ADMIN_TIMEOUT_MS)
 def products_view():
     produtos = Produto.query.all()
     return render_template('products.html', produtos=produtos)
@@ -143,6 +137,7 @@ def settings_view():
 
 @app.route('/clientes', endpoint='list_clientes')
 @login_required 
+@somente_leitura(timeout_ms=DB_ADMIN_TIMEOUT_MS)
 def list_clientes():
     todos_clientes = Cliente.query.all()
     user_role = session.get('user_role', 'atendente') 
@@ -230,6 +225,7 @@ def create_cliente():
 
 @app.route('/api/chat/<int:cliente_id>')
 @login_required
+@somente_leitura(timeout_ms=DB_ADMIN_TIMEOUT_MS)
 def api_get_chat(cliente_id):
     try:
         msgs = Mensagem.query.filter_by(cliente_id=cliente_id).order_by(Mensagem.timestamp).all()
@@ -245,6 +241,7 @@ def api_get_chat(cliente_id):
             data.append({'role': role_fmt, 'conteudo': m.conteudo, 'time': hora})
         return jsonify(data)
     except Exception as e:
+        if erro_da_replica(e): raise # somente_leitura repete no primário
         print(f"Erro API Chat: {e}")
         return jsonify([]), 500
 
@@ -254,16 +251,13 @@ def api_send_human():
     data = request.json
     cliente = Cliente.query.get_or_404(data.get('cliente_id'))
     
-    if not verificar_e_consumir_token(COST_MESSAGE):
+    if not tem_saldo(COST_MESSAGE):
         return jsonify({'error': 'Sem saldo'}), 402
 
     # Envio Twilio
     try:
-        sid = os.getenv('TWILIO_ACCOUNT_SID')
-        token = os.getenv('TWILIO_AUTH_TOKEN')
-        from_ = os.getenv('TWILIO_PHONE_NUMBER')
-        if sid and token:
-            Client(sid, token).messages.create(body=data.get('texto'), from_=from_, to=cliente.telefone)
+        if twilio_configurado():
+            enviar_mensagem(data.get('texto'), cliente.telefone)
     except Exception as e:
         print(f"Erro Twilio: {e}")
         # Retorna erro mas salva no banco? Decisão de negócio.
@@ -273,6 +267,8 @@ def api_send_human():
     db.session.add(msg)
     cliente.modo = 'humano'
     db.session.commit()
+    registrar_consumo('envio_humano', cliente_id=cliente.id,
+                      usuario_id=session.get('user_id'), creditos=COST_MESSAGE)
     return jsonify({'status': 'ok'})
 
 @app.route('/api/toggle_mode/<int:cliente_id>', methods=['POST'])
@@ -293,12 +289,91 @@ def api_assistente_pessoal():
     
     try:
         # Chama serviço Gemini com tools
-        resp = processar_assistente_prompt(prompt, user_role)
+        resp = processar_assistente_prompt(prompt, user_role, session.get('user_id'))
         return jsonify({'resposta': resp})
     except Exception as e:
         print(f"Erro Assistente: {e}")
         return jsonify({'resposta': 'Erro interno.'}), 500
 
+@app.route('/api/assistente_pessoal/reset', methods=['POST'])
+@login_required
+def api_assistente_reset():
+    try:
+        resetar_sessao(session.get('user_id'))
+        return jsonify({'status': 'ok'})
+    except Exception as e:
+        print(f"Erro Reset Assistente: {e}")
+        db.session.rollback()
+        return jsonify({'error': 'erro'}), 500
+
+@app.route('/api/relatorios/custos')
+@admin_required
+def api_relatorio_custos():
+    dias = request.args.get('dias', 30, type=int)
+    limite = request.args.get('limite', 50, type=int)
+    return jsonify({
+        'consumo': consumo_tokens(dias),
+        'por_cliente': custo_por_cliente(dias, limite)
+    })
+
+# --- IMPORTAÇÃO / EXPORTAÇÃO EM MASSA ---
+
+MIMETYPES_EXPORT = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+
+def _formato_requisitado(padrao):
+    formato = request.args.get('formato', padrao).lower()
+    return formato if formato in MIMETYPES_EXPORT else None
+
+def _resposta_streaming(gerador, formato, nome_arquivo):
+    return Response(
+        stream_with_context(gerador),
+        mimetype=MIMETYPES_EXPORT[formato],
+        headers={'Content-Disposition': f'attachment; filename={nome_arquivo}.{formato}'}
+    )
+
+@app.route('/api/import/clientes', methods=['POST'])
+@admin_required
+def api_import_clientes():
+    # Aceita upload de formulário (campo 'arquivo') ou o corpo cru da requisição
+    arquivo = request.files.get('arquivo')
+    if arquivo:
+        padrao = 'ndjson' if arquivo.filename.lower().endswith(('.ndjson', '.jsonl')) else 'csv'
+        stream = arquivo.stream
+    else:
+        padrao = 'ndjson' if 'json' in (request.content_type or '') else 'csv'
+        stream = request.stream
+
+    formato = _formato_requisitado(padrao)
+    if not formato:
+        return jsonify({'error': 'Formato inválido (use csv ou ndjson)'}), 400
+
+    relatorio = novo_relatorio()
+    try:
+        importar_clientes(stream, formato, relatorio)
+    except Exception as e:
+        print(f"Erro Importação: {e}")
+        db.session.rollback()
+        # Lotes já gravados continuam gravados: devolve até onde chegou
+        return jsonify({'error': 'Falha na importação', **relatorio}), 500
+    return jsonify({'status': 'ok', **relatorio})
+
+@app.route('/api/export/clientes')
+@admin_required
+def api_export_clientes():
+    formato = _formato_requisitado('csv')
+    if not formato:
+        return jsonify({'error': 'Formato inválido (use csv ou ndjson)'}), 400
+    return _resposta_streaming(exportar_clientes(formato), formato, 'clientes')
+
+@app.route('/api/export/mensagens')
+@admin_required
+def api_export_mensagens():
+    formato = _formato_requisitado('ndjson')
+    if not formato:
+        return jsonify({'error': 'Formato inválido (use csv ou ndjson)'}), 400
+    cliente_id = request.args.get('cliente_id', type=int)
+    return _resposta_streaming(exportar_mensagens(formato, cliente_id), formato, 'mensagens')
+
 @app.route('/api/sync/produtos', methods=['POST'])
 def sync_produtos():
     # Rota protegida por token no header (idealmente)
@@ -324,10 +399,10 @@ def whatsapp_reply():
     # 1. Captura e Setup
     remetente = request.values.get('From', '')
     texto = request.values.get('Body', '').strip()
-    resp_xml_vazio = MessagingResponse() # Vamos retornar vazio pro webhook não reclamar
+    resp_xml_vazio = TWIML_VAZIO # Vamos retornar vazio pro webhook não reclamar
 
     if not texto:
-        return Response(str(resp_xml_vazio), content_type='application/xml')
+        return Response(resp_xml_vazio, content_type='application/xml')
 
     # 2. Banco e Cliente
     try:
@@ -344,12 +419,12 @@ def whatsapp_reply():
         db.session.commit()
     except Exception as e:
         print(f"!!! [ERRO DB] {e}")
-        return Response(str(resp_xml_vazio), content_type='application/xml')
+        return Response(resp_xml_vazio, content_type='application/xml')
 
     # 3. Verifica Modo/Tokens
-    if cliente.modo == 'humano' or not verificar_e_consumir_token(COST_MESSAGE):
+    if cliente.modo == 'humano' or not tem_saldo():
         print(">>> Bot pausado (Humano ou Sem Tokens)")
-        return Response(str(resp_xml_vazio), content_type='application/xml')
+        return Response(resp_xml_vazio, content_type='application/xml')
 
     # 4. GERAÇÃO DA IA (Igual antes)
     resposta_ia = ""
@@ -360,7 +435,13 @@ def whatsapp_reply():
         print(">>> Chamando Gemini...", flush=True)
         model = iniciar_modelo(gerar_prompt_dinamico())
         chat = model.start_chat(history=history)
-        resposta_ia = chat.send_message(texto).text
+        response = chat.send_message(texto)
+        resposta_ia = response.text
+
+        # Cobra pelo uso real (tokens do prompt com catálogo + resposta)
+        tokens_prompt, tokens_resposta = extrair_uso(response)
+        creditos = registrar_consumo('whatsapp', tokens_prompt, tokens_resposta, cliente_id=cliente.id)
+        print(f">>> Tokens: prompt={tokens_prompt} resposta={tokens_resposta} ({creditos} créditos)")
         print(f">>> Gemini Respondeu: {resposta_ia[:30]}...")
 
     except Exception as e:
@@ -379,19 +460,9 @@ def whatsapp_reply():
 
         # ENVIA DIRETO PRO TWILIO (Sem depender do retorno do Webhook)
         try:
-            account_sid = os.getenv('TWILIO_ACCOUNT_SID')
-            auth_token = os.getenv('TWILIO_AUTH_TOKEN')
-            # O numero do .env TEM QUE TER 'whatsapp:'
-            from_number = os.getenv('TWILIO_PHONE_NUMBER') 
-
-            print(f">>> [ENVIANDO] De: {from_number} Para: {remetente}", flush=True)
+            print(f">>> [ENVIANDO] De: {os.getenv('TWILIO_PHONE_NUMBER')} Para: {remetente}", flush=True)
             
-            client = Client(account_sid, auth_token)
-            message = client.messages.create(
-                body=resposta_ia,
-                from_=from_number,
-                to=remetente
-            )
+            message = enviar_mensagem(resposta_ia, remetente)
             print(f">>> [SUCESSO] Mensagem enviada! SID: {message.sid}", flush=True)
             
         except Exception as e:
@@ -399,7 +470,7 @@ def whatsapp_reply():
             print(f"!!! [ERRO TWILIO API] O motivo do silencio é: {e}", flush=True)
 
     # Retorna XML vazio só pra fechar a conexão HTTP com 200 OK
-    return Response(str(resp_xml_vazio), content_type='application/xml')
+    return Response(resp_xml_vazio, content_type='application/xml')
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
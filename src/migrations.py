@@ -0,0 +1,131 @@
+from datetime import datetime
+from sqlalchemy import inspect, text
+from src.models import db
+
+# =========================================================
+# MIGRAÇÕES VERSIONADAS DO SCHEMA
+# =========================================================
+# Cada migração roda UMA vez e fica registrada em 'schema_migrations'.
+# Regras:
+#   - Nunca edite uma migração já publicada: crie a próxima versão.
+#   - A migração 1 é a exceção: ela roda create_all com os models ATUAIS,
+#     então num banco novo já cria todas as colunas e índices de hoje.
+#     Toda migração posterior precisa ser no-op num banco recém-criado
+#     (IF NOT EXISTS, checkfirst=True, checar a coluna antes do ALTER).
+#   - Índice em tabela grande: use _criar_indice e coloque a versão em
+#     SEM_TRANSACAO (CONCURRENTLY no Postgres, sem travar os INSERTs).
+
+TABELA_VERSAO = 'schema_migrations'
+# Chave do pg_advisory_lock (evita dois containers migrando ao mesmo tempo)
+LOCK_MIGRACOES = 728_026_027
+
+def _m001_schema_inicial(conn):
+    # Banco novo: cria tudo a partir dos models. Banco antigo: no-op.
+    db.metadata.create_all(bind=conn)
+
+def _criar_indice(conn, nome, tabela, colunas):
+    if conn.dialect.name != 'postgresql':
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {nome} ON {tabela} ({colunas})"))
+        return
+    # CONCURRENTLY não segura o lock SHARE durante o build, então o container
+    # antigo continua gravando mensagens no deploy. Precisa de conexão em
+    # autocommit. Um build concorrente que falhou deixa o índice INVALID
+    # (e o IF NOT EXISTS pularia ele): nesse caso apaga e refaz.
+    invalido = conn.execute(
+        text("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:nome)"),
+        {'nome': nome}
+    ).scalar()
+    if invalido:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {nome}"))
+    conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {nome} ON {tabela} ({colunas})"))
+
+def _m002_indices_historico(conn):
+    _criar_indice(conn, 'ix_mensagens_cliente_timestamp', 'mensagens', 'cliente_id, timestamp')
+
+def _m003_indices_relatorios(conn):
+    _criar_indice(conn, 'ix_mensagens_timestamp', 'mensagens', 'timestamp')
+    _criar_indice(conn, 'ix_clientes_created_at', 'clientes', 'created_at')
+
+def _m004_sessoes_assistente(conn):
+    db.metadata.tables['sessoes_assistente'].create(bind=conn, checkfirst=True)
+
+def _m005_consumo_tokens(conn):
+    db.metadata.tables['consumo_tokens'].create(bind=conn, checkfirst=True)
+
+MIGRACOES = [
+    (1, 'schema inicial', _m001_schema_inicial),
+    (2, 'indice mensagens(cliente_id, timestamp)', _m002_indices_historico),
+    (3, 'indices de relatorios (mensagens.timestamp, clientes.created_at)', _m003_indices_relatorios),
+    (4, 'tabela sessoes_assistente', _m004_sessoes_assistente),
+    (5, 'ledger consumo_tokens', _m005_consumo_tokens),
+]
+
+# Rodam fora de transação no Postgres (CREATE INDEX CONCURRENTLY)
+SEM_TRANSACAO = {2, 3}
+
+VERSAO_ATUAL = MIGRACOES[-1][0]
+
+def versao_do_banco(conn):
+    """Retorna a última versão aplicada (0 se o banco nunca foi migrado)."""
+    if not inspect(conn).has_table(TABELA_VERSAO):
+        return 0
+    versao = conn.execute(text(f"SELECT MAX(versao) FROM {TABELA_VERSAO}")).scalar()
+    return versao or 0
+
+def schema_atualizado():
+    with db.engine.connect() as conn:
+        return versao_do_banco(conn) >= VERSAO_ATUAL
+
+def _registrar_versao(conn, numero, descricao):
+    conn.execute(
+        text(f"INSERT INTO {TABELA_VERSAO} (versao, descricao, aplicada_em) VALUES (:v, :d, :t)"),
+        {'v': numero, 'd': descricao, 't': datetime.utcnow()}
+    )
+
+def aplicar_migracoes():
+    """Aplica as migrações pendentes em ordem. Retorna a lista de versões aplicadas."""
+    aplicadas = []
+
+    # Conexão dedicada: o advisory lock vale por conexão, não por transação
+    with db.engine.connect() as conn:
+        postgres = conn.dialect.name == 'postgresql'
+        if postgres:
+            conn.execute(text("SELECT pg_advisory_lock(:k)"), {'k': LOCK_MIGRACOES})
+            conn.commit()
+
+        try:
+            with conn.begin():
+                conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {TABELA_VERSAO} ("
+                    " versao INTEGER PRIMARY KEY,"
+                    " descricao VARCHAR(200) NOT NULL,"
+                    " aplicada_em TIMESTAMP NOT NULL)"
+                ))
+
+            # Relê a versão já com o lock (outro container pode ter migrado)
+            with conn.begin():
+                versao = versao_do_banco(conn)
+
+            for numero, descricao, migracao in MIGRACOES:
+                if numero <= versao:
+                    continue
+                print(f"🧱 Aplicando migração {numero:03d}: {descricao}...")
+                if postgres and numero in SEM_TRANSACAO:
+                    # Conexão à parte em autocommit; a versão só é gravada depois
+                    # que o índice terminou (se cair no meio, a migração roda de novo)
+                    with db.engine.connect() as auto:
+                        migracao(auto.execution_options(isolation_level='AUTOCOMMIT'))
+                    with conn.begin():
+                        _registrar_versao(conn, numero, descricao)
+                else:
+                    # Migração + registro da versão na mesma transação
+                    with conn.begin():
+                        migracao(conn)
+                        _registrar_versao(conn, numero, descricao)
+                aplicadas.append(numero)
+        finally:
+            if postgres:
+                conn.execute(text("SELECT pg_advisory_unlock(:k)"), {'k': LOCK_MIGRACOES})
+                conn.commit()
+
+    return aplicadas
@@ -1,9 +1,11 @@
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.dialects.postgresql import JSONB
 from datetime import datetime
+from src.services.db_router import RoteadorSession
 
 # Inicializamos o objeto db aqui (sem import circular)
-db = SQLAlchemy()
+# A session customizada manda leituras marcadas para a réplica (se houver)
+db = SQLAlchemy(session_options={'class_': RoteadorSession})
 
 # ----------------------------------------------------------------
 # TABELA 1: CONFIGURAÇÃO DO BOT (Prompt e Personalidade)
@@ -27,6 +29,10 @@ class BotConfig(db.Model):
 # ----------------------------------------------------------------
 class Cliente(db.Model):
     __tablename__ = 'clientes'
+    # Relatórios de leads filtram por data de cadastro
+    __table_args__ = (
+        db.Index('ix_clientes_created_at', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     
@@ -54,6 +60,12 @@ class Cliente(db.Model):
 # ----------------------------------------------------------------
 class Mensagem(db.Model):
     __tablename__ = 'mensagens'
+    # Histórico do chat e do webhook sempre filtra por cliente e ordena por data
+    __table_args__ = (
+        db.Index('ix_mensagens_cliente_timestamp', 'cliente_id', 'timestamp'),
+        # Relatórios de volume/horário filtram só por data
+        db.Index('ix_mensagens_timestamp', 'timestamp'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     cliente_id = db.Column(db.Integer, db.ForeignKey('clientes.id'), nullable=False)
@@ -85,4 +97,40 @@ class Usuario(db.Model):
     role = db.Column(db.String(20), default='admin') 
     
     def __repr__(self):
-        return f'<Usuario {self.username}>'
\ No newline at end of file
+        return f'<Usuario {self.username}>'
+
+# ----------------------------------------------------------------
+# TABELA 6: SESSÕES DO ASSISTENTE PESSOAL (histórico por usuário)
+# ----------------------------------------------------------------
+class SessaoAssistente(db.Model):
+    __tablename__ = 'sessoes_assistente'
+
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id', ondelete='CASCADE'), primary_key=True)
+    # Histórico do chat do Gemini (lista de Content serializada em JSON)
+    historico = db.Column(db.Text, nullable=False, default='[]')
+    # Incrementa a cada gravação: os workers comparam antes de reler o JSON
+    versao = db.Column(db.Integer, nullable=False, default=1)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# ----------------------------------------------------------------
+# TABELA 7: LEDGER DE CONSUMO DE TOKENS (cobrança por uso real)
+# ----------------------------------------------------------------
+class ConsumoToken(db.Model):
+    __tablename__ = 'consumo_tokens'
+    # Relatórios por período e por cliente
+    __table_args__ = (
+        db.Index('ix_consumo_tokens_criado_em', 'criado_em'),
+        db.Index('ix_consumo_tokens_cliente_criado_em', 'cliente_id', 'criado_em'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    cliente_id = db.Column(db.Integer, db.ForeignKey('clientes.id', ondelete='SET NULL'), nullable=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id', ondelete='SET NULL'), nullable=True)
+    # 'whatsapp', 'assistente' ou 'envio_humano'
+    origem = db.Column(db.String(20), nullable=False)
+    # Tokens reais reportados pelo Gemini (usage_metadata)
+    tokens_prompt = db.Column(db.Integer, nullable=False, default=0)
+    tokens_resposta = db.Column(db.Integer, nullable=False, default=0)
+    # Quanto foi debitado do saldo (créditos)
+    creditos = db.Column(db.Integer, nullable=False, default=0)
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,170 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from src.config import env_int, env_bool
+from src.models import db, SessaoAssistente
+
+# =========================================================
+# SESSÕES DO ASSISTENTE PESSOAL (HISTÓRICO POR USUÁRIO)
+# =========================================================
+# Cache LRU em memória (por worker) com expiração por inatividade.
+# Com ASSISTENTE_SESSAO_DB ligado, o histórico também vai pra tabela
+# 'sessoes_assistente' e vale pra todos os workers do gunicorn: cada
+# worker só relê o JSON quando a 'versao' no banco mudou.
+
+# Máximo de mensagens (Content) guardadas, contando chamadas e retornos de tools
+MAX_HISTORICO = env_int('ASSISTENTE_MAX_HISTORICO', 30)
+# Retorno de tool guardado no histórico é cortado neste tamanho (caracteres JSON)
+MAX_CHARS_TOOL = env_int('ASSISTENTE_MAX_CHARS_TOOL', 1500)
+# Tamanho máximo do histórico inteiro serializado (caracteres JSON)
+MAX_CHARS_HISTORICO = env_int('ASSISTENTE_MAX_CHARS_HISTORICO', 20000)
+# Sessão parada por mais que isso (s) começa do zero
+SESSAO_TTL = env_int('ASSISTENTE_SESSAO_TTL', 1800)
+# Quantos usuários ficam no cache em memória do worker
+MAX_SESSOES_CACHE = env_int('ASSISTENTE_MAX_SESSOES', 200)
+USAR_DB = env_bool('ASSISTENTE_SESSAO_DB', True)
+
+# usuario_id -> (ultimo_acesso, versao, historico)
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+def _content_para_dict(content):
+    if isinstance(content, dict):
+        return content
+    return type(content).to_dict(content)
+
+def _inicio_de_turno(content):
+    """True se a mensagem é um texto do usuário (não retorno de tool)."""
+    return content.get('role') == 'user' and any('text' in p for p in content.get('parts', []))
+
+def _compactar_tool_result(content):
+    """
+    Corta retornos de tool grandes (ex.: buscar_informacoes_cliente com as
+    mensagens do cliente). O modelo já usou o resultado inteiro no turno em
+    que a tool rodou; pro histórico basta um resumo.
+    """
+    partes = []
+    for parte in content.get('parts', []):
+        resposta = parte.get('function_response')
+        if resposta:
+            texto = json.dumps(resposta.get('response'), ensure_ascii=False, default=str)
+            if len(texto) > MAX_CHARS_TOOL:
+                parte = {**parte, 'function_response': {
+                    **resposta, 'response': {'result': texto[:MAX_CHARS_TOOL] + ' ...[truncado]'}
+                }}
+        partes.append(parte)
+    return {**content, 'parts': partes}
+
+def _tamanho(contents):
+    return len(json.dumps(contents, ensure_ascii=False, default=str))
+
+def podar_historico(historico, limite=None):
+    """Mantém só as últimas mensagens, sem cortar um turno no meio."""
+    limite = limite or MAX_HISTORICO
+    completo = [_compactar_tool_result(_content_para_dict(c)) for c in historico]
+    inicios = [i for i, c in enumerate(completo) if _inicio_de_turno(c)]
+    if not inicios:
+        return []
+    # Não pode começar com resposta do modelo ou function_response órfão.
+    # Se um turno sozinho passar do limite, guarda pelo menos ele inteiro.
+    candidatos = [i for i in inicios if i >= len(completo) - limite] or inicios[-1:]
+    # Também limita pelo tamanho: descarta turnos antigos até caber
+    while len(candidatos) > 1 and _tamanho(completo[candidatos[0]:]) > MAX_CHARS_HISTORICO:
+        candidatos.pop(0)
+    return completo[candidatos[0]:]
+
+def _guardar_no_cache(usuario_id, versao, historico):
+    _cache[usuario_id] = (time.monotonic(), versao, historico)
+    _cache.move_to_end(usuario_id)
+    while len(_cache) > MAX_SESSOES_CACHE:
+        _cache.popitem(last=False)
+
+def _expirar_cache():
+    limite = time.monotonic() - SESSAO_TTL
+    for usuario_id in [u for u, (acesso, _, _) in _cache.items() if acesso < limite]:
+        del _cache[usuario_id]
+
+def carregar_historico(usuario_id):
+    """Retorna o histórico (lista de dicts) do assistente para o usuário."""
+    if usuario_id is None:
+        return []
+
+    with _lock:
+        _expirar_cache()
+        em_cache = _cache.get(usuario_id)
+
+    if not USAR_DB:
+        if not em_cache:
+            return []
+        with _lock:
+            _guardar_no_cache(usuario_id, em_cache[1], em_cache[2])
+        return list(em_cache[2])
+
+    try:
+        # Consulta leve: só a versão e a data. O JSON só vem se mudou.
+        linha = db.session.query(SessaoAssistente.versao, SessaoAssistente.atualizado_em) \
+                          .filter_by(usuario_id=usuario_id).first()
+        if not linha or linha.atualizado_em < datetime.utcnow() - timedelta(seconds=SESSAO_TTL):
+            with _lock:
+                _cache.pop(usuario_id, None)
+            return []
+
+        if em_cache and em_cache[1] == linha.versao:
+            historico = em_cache[2]
+        else:
+            texto = db.session.query(SessaoAssistente.historico).filter_by(usuario_id=usuario_id).scalar()
+            historico = json.loads(texto or '[]')
+
+        with _lock:
+            _guardar_no_cache(usuario_id, linha.versao, historico)
+        return list(historico)
+    except Exception as e:
+        print(f"⚠️ Falha ao carregar sessão do assistente: {e}")
+        db.session.rollback()
+        return list(em_cache[2]) if em_cache else []
+
+def salvar_historico(usuario_id, historico):
+    """Poda e grava o histórico (memória e, se ligado, banco)."""
+    if usuario_id is None:
+        return
+    historico = podar_historico(historico)
+
+    if not USAR_DB:
+        with _lock:
+            _guardar_no_cache(usuario_id, 0, historico)
+        return
+
+    try:
+        sessao = db.session.get(SessaoAssistente, usuario_id)
+        if not sessao:
+            sessao = SessaoAssistente(usuario_id=usuario_id, versao=1)
+            db.session.add(sessao)
+        else:
+            # Incremento no próprio UPDATE (dois workers gravando ao mesmo tempo)
+            sessao.versao = SessaoAssistente.versao + 1
+        sessao.historico = json.dumps(historico, ensure_ascii=False)
+        sessao.atualizado_em = datetime.utcnow()
+        db.session.commit()
+        with _lock:
+            _guardar_no_cache(usuario_id, sessao.versao, historico)
+    except Exception as e:
+        print(f"⚠️ Falha ao salvar sessão do assistente: {e}")
+        db.session.rollback()
+
+def resetar_sessao(usuario_id):
+    """Apaga o histórico do assistente do usuário (nova conversa)."""
+    with _lock:
+        _cache.pop(usuario_id, None)
+    if USAR_DB and usuario_id is not None:
+        # Esvazia em vez de apagar: se a linha sumisse, a próxima gravação
+        # voltaria pra versao=1 e outro worker com o histórico antigo em cache
+        # (na mesma versão) continuaria servindo e regravando a conversa velha.
+        SessaoAssistente.query.filter_by(usuario_id=usuario_id).update({
+            'historico': '[]',
+            'versao': SessaoAssistente.versao + 1,
+            'atualizado_em': datetime.utcnow(),
+        }, synchronize_session=False)
+        db.session.commit()
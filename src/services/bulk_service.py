@@ -0,0 +1,260 @@
+import codecs
+import csv
+import io
+import json
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from src.config import env_int
+from src.models import db, Cliente, Mensagem
+from src.services.db_router import executar_leitura
+
+# =========================================================
+# IMPORTAÇÃO / EXPORTAÇÃO EM MASSA (STREAMING)
+# =========================================================
+# Importação: lê o corpo linha a linha (CSV ou NDJSON) e faz upsert em
+# lotes por telefone. Exportação: generators com cursor no servidor, então
+# a memória fica constante mesmo com milhões de mensagens.
+
+IMPORT_BATCH_SIZE = env_int('IMPORT_BATCH_SIZE', 1000)
+EXPORT_CHUNK_SIZE = env_int('EXPORT_CHUNK_SIZE', 2000)
+# Quantos erros detalhados voltam na resposta (o total é sempre contado)
+MAX_ERROS_REPORTADOS = 200
+
+CAMPOS_CLIENTE = ['telefone', 'nome', 'tem_suporte', 'custom_data', 'modo', 'created_at']
+MODOS_VALIDOS = ('bot', 'humano')
+
+def _para_bool(valor):
+    if isinstance(valor, bool):
+        return valor
+    if valor is None:
+        return False
+    return str(valor).strip().lower() in ('1', 'true', 'sim', 'yes', 's', 'x')
+
+def _texto(valor):
+    if valor is None:
+        return None
+    valor = str(valor).strip()
+    return valor or None
+
+def validar_linha_cliente(dados):
+    """Normaliza uma linha de importação. Levanta ValueError se estiver inválida."""
+    if not isinstance(dados, dict):
+        raise ValueError("linha não é um objeto")
+
+    telefone = _texto(dados.get('telefone'))
+    nome = _texto(dados.get('nome'))
+    if not telefone or not nome:
+        raise ValueError("telefone e nome são obrigatórios")
+    if len(telefone) > 50:
+        raise ValueError("telefone com mais de 50 caracteres")
+    if len(nome) > 100:
+        raise ValueError("nome com mais de 100 caracteres")
+
+    custom_data = _texto(dados.get('custom_data'))
+    if custom_data and len(custom_data) > 255:
+        raise ValueError("custom_data com mais de 255 caracteres")
+
+    modo = _texto(dados.get('modo')) or 'bot'
+    if modo not in MODOS_VALIDOS:
+        raise ValueError(f"modo inválido '{modo}'")
+
+    return {
+        'telefone': telefone,
+        'nome': nome,
+        'tem_suporte': _para_bool(dados.get('tem_suporte')),
+        'custom_data': custom_data,
+        'modo': modo,
+        'created_at': datetime.utcnow(),
+    }
+
+def _decodificar(stream, invalidas):
+    """Decodifica o stream linha a linha; guarda em 'invalidas' as que não são UTF-8."""
+    for numero, bruta in enumerate(stream, start=1):
+        if numero == 1 and bruta.startswith(codecs.BOM_UTF8):
+            bruta = bruta[len(codecs.BOM_UTF8):]
+        try:
+            yield bruta.decode('utf-8')
+        except UnicodeDecodeError:
+            # Ex.: CSV salvo pelo Excel em cp1252. Erro só nesta linha, não na importação toda
+            invalidas.add(numero)
+            yield bruta.decode('utf-8', errors='replace')
+
+def ler_linhas(stream, formato):
+    """Gera (numero_linha, dict | Exception) a partir de um stream binário."""
+    # Decodifica cada linha na mão (e não com io.TextIOWrapper: o upload vem num
+    # SpooledTemporaryFile, que no Python 3.9 não tem readable())
+    invalidas = set()
+    texto = _decodificar(stream, invalidas)
+    erro_encoding = ValueError("texto não é UTF-8 válido (salve o arquivo como UTF-8)")
+
+    if formato == 'ndjson':
+        for numero, linha in enumerate(texto, start=1):
+            if numero in invalidas:
+                yield numero, erro_encoding
+                continue
+            if not linha.strip():
+                continue
+            try:
+                yield numero, json.loads(linha)
+            except ValueError as e:
+                yield numero, ValueError(f"JSON inválido: {e}")
+    else:
+        leitor = csv.DictReader(texto)
+        if leitor.fieldnames and 1 in invalidas:
+            yield 1, ValueError("cabeçalho não é UTF-8 válido (salve o arquivo como UTF-8)")
+            return
+        anterior = leitor.line_num
+        for dados in leitor:
+            # Um registro CSV pode ocupar várias linhas físicas (campo com quebra de linha)
+            if any(n in invalidas for n in range(anterior + 1, leitor.line_num + 1)):
+                yield leitor.line_num, erro_encoding
+            else:
+                yield leitor.line_num, dados
+            anterior = leitor.line_num
+
+def _upsert_clientes(linhas):
+    """Upsert de um lote por telefone. 'modo' e 'created_at' só valem para novos."""
+    insert = pg_insert if db.engine.dialect.name == 'postgresql' else sqlite_insert
+    stmt = insert(Cliente.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['telefone'],
+        set_={
+            'nome': stmt.excluded.nome,
+            'tem_suporte': stmt.excluded.tem_suporte,
+            'custom_data': stmt.excluded.custom_data,
+        }
+    )
+    db.session.execute(stmt, linhas)
+
+def _gravar_lote(lote, relatorio):
+    # Mesmo telefone duas vezes no lote quebra o ON CONFLICT: vale a última
+    por_telefone = {}
+    for numero, linha in lote:
+        repetida = por_telefone.get(linha['telefone'])
+        if repetida:
+            _registrar_erro(relatorio, repetida[0], f"telefone repetido, substituído pela linha {numero}")
+        por_telefone[linha['telefone']] = (numero, linha)
+
+    try:
+        _upsert_clientes([linha for _, linha in por_telefone.values()])
+        db.session.commit()
+        relatorio['importadas'] += len(por_telefone)
+        return
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️ Lote de importação falhou ({e}). Regravando linha a linha...")
+
+    # Fallback: descobre qual linha quebrou o lote
+    for numero, linha in por_telefone.values():
+        try:
+            _upsert_clientes([linha])
+            db.session.commit()
+            relatorio['importadas'] += 1
+        except Exception as e:
+            db.session.rollback()
+            _registrar_erro(relatorio, numero, str(getattr(e, 'orig', e)))
+
+def _registrar_erro(relatorio, numero, mensagem):
+    relatorio['total_erros'] += 1
+    if len(relatorio['erros']) < MAX_ERROS_REPORTADOS:
+        relatorio['erros'].append({'linha': numero, 'erro': mensagem})
+
+def novo_relatorio():
+    return {'processadas': 0, 'importadas': 0, 'total_erros': 0, 'erros': []}
+
+def importar_clientes(stream, formato='csv', relatorio=None):
+    """
+    Importa clientes de um stream CSV/NDJSON. Retorna o relatório por linha.
+    Quem passa o próprio 'relatorio' ainda consegue lê-lo se a importação
+    falhar no meio (os lotes anteriores já foram gravados).
+    """
+    relatorio = relatorio if relatorio is not None else novo_relatorio()
+    lote = []
+
+    for numero, dados in ler_linhas(stream, formato):
+        relatorio['processadas'] += 1
+        try:
+            if isinstance(dados, Exception):
+                raise dados
+            lote.append((numero, validar_linha_cliente(dados)))
+        except ValueError as e:
+            _registrar_erro(relatorio, numero, str(e))
+            continue
+
+        if len(lote) >= IMPORT_BATCH_SIZE:
+            _gravar_lote(lote, relatorio)
+            lote = []
+
+    if lote:
+        _gravar_lote(lote, relatorio)
+
+    print(f"📥 Importação: {relatorio['importadas']} ok, {relatorio['total_erros']} erros.")
+    return relatorio
+
+# ---------------------------------------------------------
+# EXPORTAÇÃO
+# ---------------------------------------------------------
+
+def _linhas_streaming(query):
+    # stream_results = cursor no servidor (psycopg2); yield_per = lote por fetch.
+    # A query roda aqui (fora do generator) para a falha da réplica cair no
+    # primário antes da resposta começar.
+    query = query.execution_options(stream_results=True, yield_per=EXPORT_CHUNK_SIZE)
+    resultado = executar_leitura(query)
+    return (linha._asdict() for linha in resultado)
+
+def _serializar(valor):
+    return valor.isoformat() if isinstance(valor, datetime) else valor
+
+def _gerar_csv(linhas, campos):
+    buffer = io.StringIO()
+    escritor = csv.DictWriter(buffer, fieldnames=campos)
+    escritor.writeheader()
+    for i, linha in enumerate(linhas, start=1):
+        escritor.writerow({k: _serializar(v) for k, v in linha.items()})
+        if i % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+def _gerar_ndjson(linhas):
+    pedaco = []
+    for linha in linhas:
+        pedaco.append(json.dumps({k: _serializar(v) for k, v in linha.items()}, ensure_ascii=False))
+        if len(pedaco) >= EXPORT_CHUNK_SIZE:
+            yield '\n'.join(pedaco) + '\n'
+            pedaco = []
+    if pedaco:
+        yield '\n'.join(pedaco) + '\n'
+
+def exportar_clientes(formato='csv'):
+    """Generator com todos os clientes (sem carregar tudo na memória)."""
+    query = select(
+        Cliente.id, Cliente.telefone, Cliente.nome, Cliente.tem_suporte,
+        Cliente.custom_data, Cliente.modo, Cliente.created_at
+    ).order_by(Cliente.id)
+    linhas = _linhas_streaming(query)
+    if formato == 'ndjson':
+        return _gerar_ndjson(linhas)
+    return _gerar_csv(linhas, ['id'] + CAMPOS_CLIENTE)
+
+def exportar_mensagens(formato='ndjson', cliente_id=None):
+    """Generator com o histórico completo de conversas (ou de um cliente)."""
+    query = select(
+        Mensagem.id, Mensagem.cliente_id, Cliente.telefone,
+        Mensagem.role, Mensagem.conteudo, Mensagem.timestamp
+    ).join(Cliente, Cliente.id == Mensagem.cliente_id)
+    if cliente_id is not None:
+        query = query.where(Mensagem.cliente_id == cliente_id)
+    # Ordem do índice ix_mensagens_cliente_timestamp
+    query = query.order_by(Mensagem.cliente_id, Mensagem.timestamp, Mensagem.id)
+
+    linhas = _linhas_streaming(query)
+    if formato == 'csv':
+        return _gerar_csv(linhas, ['id', 'cliente_id', 'telefone', 'role', 'conteudo', 'timestamp'])
+    return _gerar_ndjson(linhas)
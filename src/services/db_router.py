@@ -0,0 +1,181 @@
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+
+from src import config
+
+# =========================================================
+# ROTEAMENTO PRIMÁRIO x RÉPLICA + TIMEOUT POR ENDPOINT
+# =========================================================
+# O webhook (escrita) sempre vai no primário. Views do painel e tools de
+# consulta marcam o contexto como "leitura" e, se existir a bind 'replica',
+# as queries vão pra lá. Se a réplica cair, ela fica de castigo por
+# DB_REPLICA_RETRY_SECONDS e tudo volta pro primário.
+
+PGCODE_QUERY_CANCELED = '57014'
+
+_replica_indisponivel_ate = 0.0
+
+def replica_disponivel():
+    return time.monotonic() >= _replica_indisponivel_ate
+
+def marcar_replica_indisponivel():
+    global _replica_indisponivel_ate
+    _replica_indisponivel_ate = time.monotonic() + config.DB_REPLICA_RETRY_SECONDS
+    print(f"⚠️ Réplica indisponível. Usando primário por {config.DB_REPLICA_RETRY_SECONDS}s.")
+
+def _rota_leitura_ativa():
+    return has_app_context() and g.get('db_rota') == 'replica'
+
+class RoteadorSession(Session):
+    """Session que manda leituras marcadas para a réplica (quando configurada)."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and _rota_leitura_ativa()
+                and replica_disponivel()):
+            replica = self._db.engines.get('replica')
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@event.listens_for(RoteadorSession, 'after_begin')
+def _aplicar_statement_timeout(session, transaction, connection):
+    # Roda a cada conexão nova da transação (primário e réplica separados).
+    # Guarda a conexão por engine pro _timeout_na_transacao_aberta.
+    session.info.setdefault('conexoes_abertas', {})[connection.engine] = connection
+    # SET LOCAL vale só até o fim da transação, então não vaza pro pool
+    timeout_ms = g.get('db_timeout_ms') if has_app_context() else None
+    if timeout_ms and connection.dialect.name == 'postgresql':
+        connection.execute(text(f"SET LOCAL statement_timeout = {int(timeout_ms)}"))
+
+@event.listens_for(RoteadorSession, 'after_transaction_end')
+def _esquecer_conexoes(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('conexoes_abertas', None)
+
+def _timeout_na_transacao_aberta(timeout_ms):
+    """
+    O after_begin só pega conexões novas. Se a session já tem conexão aberta
+    na bind que as próximas leituras vão usar (ex.: o assistente leu o
+    histórico no primário antes da tool, sem réplica), aplica o timeout nela
+    e devolve (conexão, valor anterior) pra restaurar.
+    """
+    from src.models import db
+
+    sessao = db.session()
+    if not timeout_ms or not sessao.in_transaction():
+        return None
+    # Primário ou réplica, conforme g.db_rota e o estado da réplica
+    alvo = sessao.get_bind()
+    conn = sessao.info.get('conexoes_abertas', {}).get(alvo)
+    if conn is None or conn.closed or conn.dialect.name != 'postgresql':
+        # Sem conexão nessa bind ainda: o after_begin aplica quando ela abrir
+        return None
+    anterior = conn.execute(text("SELECT current_setting('statement_timeout')")).scalar()
+    # set_config(..., true) = SET LOCAL, aceitando parâmetro
+    conn.execute(text("SELECT set_config('statement_timeout', :v, true)"), {'v': str(int(timeout_ms))})
+    return conn, anterior
+
+def _restaurar_timeout(estado):
+    if not estado:
+        return
+    conn, valor = estado
+    try:
+        # Se a transação já terminou, o SET LOCAL morreu junto: nada a fazer
+        if not conn.closed and conn.in_transaction():
+            conn.execute(text("SELECT set_config('statement_timeout', :v, true)"), {'v': valor})
+    except Exception as e:
+        print(f"⚠️ Não foi possível restaurar statement_timeout: {e}")
+
+@contextmanager
+def statement_timeout(timeout_ms):
+    """Aplica statement_timeout nas transações novas e na que já estiver aberta."""
+    timeout_anterior = g.get('db_timeout_ms')
+    if timeout_ms:
+        g.db_timeout_ms = timeout_ms
+    estado = _timeout_na_transacao_aberta(timeout_ms)
+    try:
+        yield
+    finally:
+        g.db_timeout_ms = timeout_anterior
+        _restaurar_timeout(estado)
+
+@contextmanager
+def usar_replica(timeout_ms=None):
+    """Marca o bloco como somente leitura (réplica + timeout opcional)."""
+    rota_anterior = g.get('db_rota')
+    # Rota antes do timeout: o timeout vai na conexão da bind que vai ser usada
+    g.db_rota = 'replica'
+    try:
+        with statement_timeout(timeout_ms):
+            yield
+    finally:
+        g.db_rota = rota_anterior
+
+def _falha_da_replica(erro):
+    """True se o erro justifica cair pro primário (e não é timeout da query)."""
+    from src.models import db
+
+    # Timeout estourado (query_canceled) não é culpa da réplica
+    if getattr(erro.orig, 'pgcode', None) == PGCODE_QUERY_CANCELED:
+        return False
+    return 'replica' in db.engines and replica_disponivel()
+
+def erro_da_replica(erro):
+    """
+    Para views que têm try/except próprio: True se o erro veio da réplica
+    e deve subir até o somente_leitura (que repete a chamada no primário).
+    """
+    return (isinstance(erro, OperationalError) and _rota_leitura_ativa()
+            and replica_disponivel() and _falha_da_replica(erro))
+
+def executar_leitura(stmt):
+    """
+    Executa a query na réplica já (não no primeiro next() de um generator),
+    caindo pro primário se a réplica falhar. Para respostas em streaming:
+    o erro aparece antes de mandar o status 200.
+    """
+    from src.models import db
+
+    try:
+        with usar_replica():
+            return db.session.execute(stmt)
+    except OperationalError as e:
+        if not _falha_da_replica(e):
+            raise
+        print(f"❌ Erro na réplica: {e}")
+        db.session.rollback()
+        marcar_replica_indisponivel()
+    return db.session.execute(stmt)
+
+def somente_leitura(timeout_ms=None):
+    """
+    Decorator para views/tools que só leem do banco.
+    Roteia para a réplica, aplica statement_timeout e, se a réplica
+    falhar na conexão, repete a chamada no primário.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            from src.models import db
+
+            try:
+                with usar_replica(timeout_ms):
+                    return f(*args, **kwargs)
+            except OperationalError as e:
+                if not _falha_da_replica(e):
+                    raise
+                print(f"❌ Erro na réplica: {e}")
+                db.session.rollback()
+                marcar_replica_indisponivel()
+
+            # Fallback: mesma chamada no primário (ainda com o timeout)
+            with statement_timeout(timeout_ms):
+                return f(*args, **kwargs)
+        return decorated_function
+    return decorator
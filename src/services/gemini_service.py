@@ -1,16 +1,26 @@
-import google.generativeai as genai
 import os
 from src.models import Produto, BotConfig
 # Importe as ferramentas e as permissões de tools do tools.py
 from src.services.tools import TOOLS_MAP, TOOLS_PERMISSIONS 
-from google.generativeai.types import Tool
+from src.services.assistente_sessoes import carregar_historico, salvar_historico
+from src.services.metering import extrair_uso, registrar_consumo
 import traceback
 
+# O SDK do Gemini é pesado: só importa/configura na primeira chamada ao modelo
+_genai = None
+
+def get_genai():
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+        _genai = genai
+    return _genai
+
 def configurar_gemini():
     api_key = os.getenv('GEMINI_API_KEY')
     if not api_key: 
         raise ValueError("A chave GEMINI_API_KEY não foi encontrada no .env")
-    genai.configure(api_key=api_key)
 
 def gerar_prompt_dinamico():
     config = BotConfig.query.first()
@@ -36,10 +46,18 @@ def gerar_prompt_dinamico():
     return prompt_final
 
 def iniciar_modelo(prompt_sistema):
-    return genai.GenerativeModel('gemini-2.5-flash', system_instruction=prompt_sistema)
+    return get_genai().GenerativeModel('gemini-2.5-flash', system_instruction=prompt_sistema)
 
-def processar_assistente_prompt(prompt_usuario: str, user_role: str) -> str:
+def processar_assistente_prompt(prompt_usuario: str, user_role: str, usuario_id: int = None) -> str:
     print(f"\n[DEBUG] --- Iniciando Assistente Pessoal ---")
+    # Tokens somados de todas as chamadas (prompt + cada volta de tool)
+    uso = {'prompt': 0, 'resposta': 0}
+
+    def somar_uso(resp):
+        tokens_prompt, tokens_resposta = extrair_uso(resp)
+        uso['prompt'] += tokens_prompt
+        uso['resposta'] += tokens_resposta
+        return resp
     
     try:
         # 1. Filtro de Tools
@@ -60,14 +78,16 @@ def processar_assistente_prompt(prompt_usuario: str, user_role: str) -> str:
             """
 
         # 3. Modelo
+        genai = get_genai()
         model = genai.GenerativeModel('gemini-2.5-flash', system_instruction=system_instruction)
-        chat = model.start_chat(history=[])
+        # Continua a conversa do usuário (inclui chamadas/retornos de tools)
+        chat = model.start_chat(history=carregar_historico(usuario_id))
         
         # Envia msg
         if tools_disponiveis:
-            response = chat.send_message(prompt_usuario, tools=tools_disponiveis)
+            response = somar_uso(chat.send_message(prompt_usuario, tools=tools_disponiveis))
         else:
-            response = chat.send_message(prompt_usuario)
+            response = somar_uso(chat.send_message(prompt_usuario))
 
         # 4. Loop de Function Calling
         def contem_function_call(resp):
@@ -92,7 +112,7 @@ def processar_assistente_prompt(prompt_usuario: str, user_role: str) -> str:
                         resultado = "Tool não encontrada."
 
                     # Devolve pro modelo
-                    response = chat.send_message(
+                    response = somar_uso(chat.send_message(
                         genai.protos.Content(
                             parts=[genai.protos.Part(
                                 function_response=genai.protos.FunctionResponse(
@@ -101,11 +121,17 @@ def processar_assistente_prompt(prompt_usuario: str, user_role: str) -> str:
                                 )
                             )]
                         )
-                    )
+                    ))
         
-        return response.text
+        resposta = response.text
+        salvar_historico(usuario_id, chat.history)
+        return resposta
 
     except Exception as e:
         print(f"❌ Erro Assistente: {e}")
         traceback.print_exc()
-        return "Erro interno no processamento."
\ No newline at end of file
+        return "Erro interno no processamento."
+    finally:
+        # Tokens gastos são cobrados mesmo se o loop quebrar no meio
+        if uso['prompt'] or uso['resposta']:
+            registrar_consumo('assistente', uso['prompt'], uso['resposta'], usuario_id=usuario_id)
@@ -0,0 +1,179 @@
+import atexit
+import math
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import DataError, IntegrityError
+
+from src import config
+from src.models import db, BotConfig, ConsumoToken
+
+# =========================================================
+# METERING: COBRANÇA PELO USO REAL DO GEMINI
+# =========================================================
+# Cada chamada ao modelo vira um registro no ledger 'consumo_tokens' com
+# os tokens de prompt/resposta do usage_metadata. Os registros ficam num
+# buffer do worker e são gravados em lote (INSERT + débito do saldo numa
+# transação só), fora do caminho quente do webhook.
+
+_buffer = []
+_lock = threading.Lock()
+_ultimo_flush = time.monotonic()
+# Avisa a thread de flush que o buffer encheu (a gravação sai da requisição)
+_flush_pedido = threading.Event()
+_app = None
+
+def extrair_uso(response):
+    """Retorna (tokens_prompt, tokens_resposta) de uma resposta do Gemini."""
+    uso = getattr(response, 'usage_metadata', None)
+    if not uso:
+        return 0, 0
+    return (getattr(uso, 'prompt_token_count', 0) or 0,
+            getattr(uso, 'candidates_token_count', 0) or 0)
+
+def calcular_creditos(tokens_prompt, tokens_resposta):
+    creditos = (tokens_prompt * config.CREDITOS_POR_1K_PROMPT
+                + tokens_resposta * config.CREDITOS_POR_1K_RESPOSTA) / 1000
+    # Toda chamada ao modelo custa pelo menos 1 crédito
+    return max(1, math.ceil(creditos))
+
+def _limitar_buffer():
+    """Chamar com _lock. Descarta os registros mais antigos além do limite."""
+    excesso = len(_buffer) - config.METERING_MAX_BUFFER
+    if excesso > 0:
+        descartados = _buffer[:excesso]
+        del _buffer[:excesso]
+        print(f"❌ Buffer do ledger cheio: descartando {excesso} registros "
+              f"({sum(item['linha']['creditos'] for item in descartados)} créditos).")
+
+def registrar_consumo(origem, tokens_prompt=0, tokens_resposta=0,
+                      cliente_id=None, usuario_id=None, creditos=None):
+    """Coloca um registro no buffer do ledger. Retorna os créditos cobrados."""
+    if creditos is None:
+        creditos = calcular_creditos(tokens_prompt, tokens_resposta)
+
+    with _lock:
+        _buffer.append({'tentativas': 0, 'linha': {
+            'cliente_id': cliente_id,
+            'usuario_id': usuario_id,
+            'origem': origem,
+            'tokens_prompt': tokens_prompt,
+            'tokens_resposta': tokens_resposta,
+            'creditos': creditos,
+            'criado_em': datetime.utcnow(),
+        }})
+        _limitar_buffer()
+        cheio = len(_buffer) >= config.METERING_FLUSH_SIZE
+
+    if cheio:
+        if _app is None:
+            # Sem thread de flush (scripts): grava na hora
+            flush()
+        else:
+            _flush_pedido.set()
+    return creditos
+
+def creditos_pendentes():
+    with _lock:
+        return sum(item['linha']['creditos'] for item in _buffer)
+
+def _gravar(linhas):
+    """INSERT no ledger + débito do saldo numa transação (conexão própria)."""
+    total = sum(linha['creditos'] for linha in linhas)
+    primeira_config = select(func.min(BotConfig.id)).scalar_subquery()
+    # Conexão própria: não mexe na transação da requisição em andamento
+    with db.engine.begin() as conn:
+        conn.execute(ConsumoToken.__table__.insert(), linhas)
+        conn.execute(
+            update(BotConfig.__table__)
+            .where(BotConfig.id == primeira_config)
+            .values(saldo_tokens=func.coalesce(BotConfig.saldo_tokens, 0) - total)
+        )
+
+def _gravar_linha_invalida(linha, erro):
+    # Ex.: usuário apagado com sessão ainda aberta -> FK quebrada.
+    # Cobra mesmo assim, só sem o vínculo; se ainda falhar, descarta.
+    try:
+        _gravar([{**linha, 'cliente_id': None, 'usuario_id': None}])
+        print(f"⚠️ Registro do ledger gravado sem cliente/usuário ({erro.orig}).")
+        return True
+    except Exception as e:
+        print(f"❌ Registro do ledger descartado ({linha['creditos']} créditos): {e}")
+        return False
+
+def flush():
+    """Grava o buffer no ledger. Retorna quantos registros foram gravados."""
+    global _ultimo_flush
+    with _lock:
+        lote = list(_buffer)
+        _buffer.clear()
+        _ultimo_flush = time.monotonic()
+    if not lote:
+        return 0
+
+    try:
+        _gravar([item['linha'] for item in lote])
+        return len(lote)
+    except Exception as e:
+        print(f"⚠️ Lote do ledger falhou ({len(lote)} registros): {e}. Regravando um a um...")
+
+    # Fallback: um registro por vez, para um registro ruim não travar os outros
+    gravados = 0
+    devolver = []
+    for posicao, item in enumerate(lote):
+        try:
+            _gravar([item['linha']])
+            gravados += 1
+        except (IntegrityError, DataError) as e:
+            # Problema do próprio registro: tentar de novo não adianta
+            gravados += _gravar_linha_invalida(item['linha'], e)
+        except Exception as e:
+            # Banco fora do ar etc.: devolve o resto pro buffer (com limite de tentativas)
+            print(f"❌ Erro ao gravar ledger de tokens: {e}")
+            for pendente in lote[posicao:]:
+                pendente['tentativas'] += 1
+                if pendente['tentativas'] >= config.METERING_MAX_TENTATIVAS:
+                    print(f"❌ Registro do ledger descartado após {pendente['tentativas']} "
+                          f"tentativas ({pendente['linha']['creditos']} créditos).")
+                else:
+                    devolver.append(pendente)
+            break
+
+    if devolver:
+        with _lock:
+            _buffer[:0] = devolver
+            _limitar_buffer()
+    return gravados
+
+def saldo_disponivel():
+    """Saldo gravado no banco menos o que ainda está no buffer deste worker."""
+    saldo = db.session.query(BotConfig.saldo_tokens).order_by(BotConfig.id).limit(1).scalar()
+    return (saldo or 0) - creditos_pendentes()
+
+def _loop_flush():
+    while True:
+        pedido = _flush_pedido.wait(timeout=config.METERING_FLUSH_INTERVAL)
+        _flush_pedido.clear()
+        if not pedido and time.monotonic() - _ultimo_flush < config.METERING_FLUSH_INTERVAL:
+            continue
+        try:
+            with _app.app_context():
+                flush()
+        except Exception as e:
+            print(f"❌ Erro no flush periódico do ledger: {e}")
+
+def _flush_na_saida():
+    if _app is not None:
+        with _app.app_context():
+            flush()
+
+def iniciar_metering(app):
+    """Liga o flush periódico do ledger (uma thread por worker)."""
+    global _app
+    if _app is not None:
+        return
+    _app = app
+    threading.Thread(target=_loop_flush, name='metering-flush', daemon=True).start()
+    atexit.register(_flush_na_saida)
@@ -1,8 +1,19 @@
 # NOVO ARQUIVO: ./src/services/tools.py
 
-from src.models import db, Cliente, Produto, Mensagem, Usuario
+from src.models import db, Cliente, Produto, Mensagem, Usuario, ConsumoToken
 from werkzeug.security import generate_password_hash
-from datetime import datetime
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+from sqlalchemy import func, extract
+from src.config import DB_ADMIN_TIMEOUT_MS, env_int
+from src.services.db_router import somente_leitura
+from src.services.metering import saldo_disponivel
+
+# Quanto tempo (s) os relatórios agregados ficam em cache por worker
+ANALYTICS_CACHE_TTL = env_int('ANALYTICS_CACHE_TTL', 60)
 
 # =========================================================
 # FUNÇÕES DE AÇÃO PARA O GEMINI USAR (FUNCTION CALLING)
@@ -32,6 +43,7 @@ def adicionar_cliente(nome: str, telefone: str, tem_suporte: bool) -> str:
         db.session.commit()
     return f"✅ Cliente {nome} cadastrado com sucesso!"
 
+@somente_leitura(timeout_ms=DB_ADMIN_TIMEOUT_MS)
 def buscar_informacoes_cliente(termo_busca: str) -> dict:
     """
     Busca um cliente pelo nome ou telefone e retorna suas informações e histórico de conversa.
@@ -70,6 +82,7 @@ def buscar_informacoes_cliente(termo_busca: str) -> dict:
         "ultimas_mensagens": mensagens_formatadas
     }
 
+@somente_leitura(timeout_ms=DB_ADMIN_TIMEOUT_MS)
 def listar_produtos_ativos() -> dict:
     """
     Retorna o catálogo completo de produtos ativos.
@@ -90,10 +103,267 @@ def listar_produtos_ativos() -> dict:
         
     return {"status": "sucesso", "total": len(produtos), "produtos": lista_produtos}
 
+# =========================================================
+# RELATÓRIOS (AGREGADOS EM SQL + CACHE CURTO)
+# =========================================================
+# Nada de carregar linhas no Python: tudo é COUNT/GROUP BY no banco,
+# em colunas indexadas (mensagens.timestamp, clientes.created_at).
+
+PERIODOS = {'hora': 'hour', 'dia': 'day', 'semana': 'week', 'mes': 'month'}
+FORMATOS_SQLITE = {'hora': '%Y-%m-%d %H:00', 'dia': '%Y-%m-%d', 'semana': '%Y-S%W', 'mes': '%Y-%m'}
+FORMATOS_SAIDA = {'hora': '%Y-%m-%d %H:00', 'dia': '%Y-%m-%d', 'semana': '%Y-%m-%d', 'mes': '%Y-%m'}
+MAX_DIAS_RELATORIO = 365
+
+# Quantas combinações (tool + argumentos) ficam no cache por worker
+MAX_CACHE_RELATORIOS = env_int('ANALYTICS_CACHE_MAX', 256)
+
+# chave -> (expira_em, resultado), em ordem de inserção (mais antigo primeiro)
+_cache_relatorios = OrderedDict()
+_lock_cache = threading.Lock()
+
+def _expirar_cache_relatorios(agora):
+    for chave in [c for c, (expira_em, _) in _cache_relatorios.items() if expira_em <= agora]:
+        del _cache_relatorios[chave]
+
+def cache_ttl(segundos):
+    """Cacheia o retorno da tool por alguns segundos (chave = nome + argumentos)."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            chave = (f.__name__, args, tuple(sorted(kwargs.items())))
+            agora = time.monotonic()
+            with _lock_cache:
+                em_cache = _cache_relatorios.get(chave)
+            if em_cache and em_cache[0] > agora:
+                return em_cache[1]
+
+            resultado = f(*args, **kwargs)
+            # Erro (ex.: período inválido inventado pelo modelo) não vai pro cache
+            if isinstance(resultado, dict) and resultado.get("status") == "erro":
+                return resultado
+
+            with _lock_cache:
+                _expirar_cache_relatorios(agora)
+                _cache_relatorios[chave] = (agora + segundos, resultado)
+                _cache_relatorios.move_to_end(chave)
+                while len(_cache_relatorios) > MAX_CACHE_RELATORIOS:
+                    _cache_relatorios.popitem(last=False)
+            return resultado
+        return decorated_function
+    return decorator
+
+def _normalizar_dias(dias):
+    # O Gemini manda números como float
+    return max(1, min(int(dias), MAX_DIAS_RELATORIO))
+
+def _truncar_data(coluna, periodo):
+    if db.engine.dialect.name == 'postgresql':
+        return func.date_trunc(PERIODOS[periodo], coluna)
+    return func.strftime(FORMATOS_SQLITE[periodo], coluna)
+
+def _formatar_periodo(valor, periodo):
+    if isinstance(valor, datetime):
+        return valor.strftime(FORMATOS_SAIDA[periodo])
+    return str(valor)
+
+@cache_ttl(ANALYTICS_CACHE_TTL)
+@somente_leitura(timeout_ms=DB_ADMIN_TIMEOUT_MS)
+def volume_mensagens(periodo: str = "dia", dias: int = 7) -> dict:
+    """
+    Conta as mensagens trocadas por período, separadas por quem enviou.
+    Args:
+        periodo (str): Agrupamento: 'hora', 'dia', 'semana' ou 'mes'.
+        dias (int): Quantos dias para trás considerar (máximo 365).
+    Returns:
+        dict: Totais por período (cliente, bot e atendente).
+    """
+    if periodo not in PERIODOS:
+        return {"status": "erro", "mensagem": f"Período inválido. Use: {list(PERIODOS)}."}
+    dias = _normalizar_dias(dias)
+    inicio = datetime.utcnow() - timedelta(days=dias)
+
+    bucket = _truncar_data(Mensagem.timestamp, periodo).label('periodo')
+    linhas = db.session.query(bucket, Mensagem.role, func.count(Mensagem.id)) \
+                       .filter(Mensagem.timestamp >= inicio) \
+                       .group_by(bucket, Mensagem.role) \
+                       .order_by(bucket).all()
+
+    role_map = {'user': 'cliente', 'model': 'bot', 'human': 'atendente'}
+    por_periodo = {}
+    for valor, role, total in linhas:
+        chave = _formatar_periodo(valor, periodo)
+        item = por_periodo.setdefault(chave, {"periodo": chave, "total": 0, "cliente": 0, "bot": 0, "atendente": 0})
+        item[role_map.get(role, 'cliente')] += total
+        item["total"] += total
+
+    return {
+        "status": "sucesso",
+        "dias": dias,
+        "total": sum(p["total"] for p in por_periodo.values()),
+        "por_periodo": list(por_periodo.values())
+    }
+
+@cache_ttl(ANALYTICS_CACHE_TTL)
+@somente_leitura(timeout_ms=DB_ADMIN_TIMEOUT_MS)
+def novos_leads(periodo: str = "dia", dias: int = 7) -> dict:
+    """
+    Conta quantos clientes novos (leads) chegaram no período.
+    Args:
+        periodo (str): Agrupamento: 'hora', 'dia', 'semana' ou 'mes'.
+        dias (int): Quantos dias para trás considerar (máximo 365).
+    Returns:
+        dict: Total de leads novos, por período e por modo de atendimento.
+    """
+    if periodo not in PERIODOS:
+        return {"status": "erro", "mensagem": f"Período inválido. Use: {list(PERIODOS)}."}
+    dias = _normalizar_dias(dias)
+    inicio = datetime.utcnow() - timedelta(days=dias)
+
+    bucket = _truncar_data(Cliente.created_at, periodo).label('periodo')
+    por_periodo = db.session.query(bucket, func.count(Cliente.id)) \
+                            .filter(Cliente.created_at >= inicio) \
+                            .group_by(bucket).order_by(bucket).all()
+    por_modo = db.session.query(Cliente.modo, func.count(Cliente.id)) \
+                         .filter(Cliente.created_at >= inicio) \
+                         .group_by(Cliente.modo).all()
+
+    return {
+        "status": "sucesso",
+        "dias": dias,
+        "total": sum(total for _, total in por_periodo),
+        "por_periodo": [{"periodo": _formatar_periodo(v, periodo), "total": t} for v, t in por_periodo],
+        "por_modo": {modo or 'bot': total for modo, total in por_modo}
+    }
+
+@cache_ttl(ANALYTICS_CACHE_TTL)
+@somente_leitura(timeout_ms=DB_ADMIN_TIMEOUT_MS)
+def leads_por_modo() -> dict:
+    """
+    Mostra quantos clientes estão hoje em cada modo de atendimento (bot ou humano).
+    Returns:
+        dict: Total de clientes por modo.
+    """
+    linhas = db.session.query(Cliente.modo, func.count(Cliente.id)).group_by(Cliente.modo).all()
+    return {
+        "status": "sucesso",
+        "total": sum(total for _, total in linhas),
+        "por_modo": {modo or 'bot': total for modo, total in linhas}
+    }
+
+@cache_ttl(ANALYTICS_CACHE_TTL)
+@somente_leitura(timeout_ms=DB_ADMIN_TIMEOUT_MS)
+def horarios_pico(dias: int = 30) -> dict:
+    """
+    Mostra os horários do dia com mais mensagens de clientes (horário UTC).
+    Args:
+        dias (int): Quantos dias para trás considerar (máximo 365).
+    Returns:
+        dict: Ranking das horas mais movimentadas.
+    """
+    dias = _normalizar_dias(dias)
+    inicio = datetime.utcnow() - timedelta(days=dias)
+
+    hora = extract('hour', Mensagem.timestamp).label('hora')
+    total = func.count(Mensagem.id).label('total')
+    linhas = db.session.query(hora, total) \
+                       .filter(Mensagem.timestamp >= inicio, Mensagem.role == 'user') \
+                       .group_by(hora).order_by(total.desc()).all()
+
+    return {
+        "status": "sucesso",
+        "dias": dias,
+        "fuso": "UTC",
+        "ranking": [{"hora": f"{int(h):02d}:00", "mensagens": t} for h, t in linhas]
+    }
+
+@cache_ttl(ANALYTICS_CACHE_TTL)
+@somente_leitura(timeout_ms=DB_ADMIN_TIMEOUT_MS)
+def consumo_tokens(dias: int = 7) -> dict:
+    """
+    Mostra o consumo de tokens do Gemini (ledger de uso real) e quantos dias o saldo ainda dura.
+    Args:
+        dias (int): Quantos dias para trás considerar (máximo 365).
+    Returns:
+        dict: Tokens e créditos consumidos por origem, média diária, saldo atual e previsão de duração do saldo.
+    """
+    dias = _normalizar_dias(dias)
+    inicio = datetime.utcnow() - timedelta(days=dias)
+
+    linhas = db.session.query(
+        ConsumoToken.origem,
+        func.count(ConsumoToken.id),
+        func.coalesce(func.sum(ConsumoToken.tokens_prompt), 0),
+        func.coalesce(func.sum(ConsumoToken.tokens_resposta), 0),
+        func.coalesce(func.sum(ConsumoToken.creditos), 0)
+    ).filter(ConsumoToken.criado_em >= inicio).group_by(ConsumoToken.origem).all()
+
+    por_origem = {
+        origem: {"chamadas": chamadas, "tokens_prompt": int(prompt),
+                 "tokens_resposta": int(resposta), "creditos": int(creditos)}
+        for origem, chamadas, prompt, resposta, creditos in linhas
+    }
+    consumidos = sum(item["creditos"] for item in por_origem.values())
+    media_diaria = consumidos / dias
+
+    saldo = saldo_disponivel()
+    return {
+        "status": "sucesso",
+        "dias": dias,
+        "creditos_consumidos": consumidos,
+        "tokens_totais": sum(i["tokens_prompt"] + i["tokens_resposta"] for i in por_origem.values()),
+        "por_origem": por_origem,
+        "media_diaria": round(media_diaria, 1),
+        "saldo_atual": saldo,
+        "dias_restantes": round(saldo / media_diaria, 1) if media_diaria else None
+    }
+
+@cache_ttl(ANALYTICS_CACHE_TTL)
+@somente_leitura(timeout_ms=DB_ADMIN_TIMEOUT_MS)
+def custo_por_cliente(dias: int = 30, limite: int = 10) -> dict:
+    """
+    Ranking dos clientes que mais consumiram tokens do Gemini no período.
+    Args:
+        dias (int): Quantos dias para trás considerar (máximo 365).
+        limite (int): Quantos clientes mostrar (máximo 100).
+    Returns:
+        dict: Clientes com tokens de prompt/resposta, créditos gastos e número de respostas.
+    """
+    dias = _normalizar_dias(dias)
+    limite = max(1, min(int(limite), 100))
+    inicio = datetime.utcnow() - timedelta(days=dias)
+
+    creditos = func.sum(ConsumoToken.creditos).label('creditos')
+    linhas = db.session.query(
+        Cliente.id, Cliente.nome, Cliente.telefone,
+        func.count(ConsumoToken.id),
+        func.sum(ConsumoToken.tokens_prompt),
+        func.sum(ConsumoToken.tokens_resposta),
+        creditos
+    ).join(Cliente, Cliente.id == ConsumoToken.cliente_id) \
+     .filter(ConsumoToken.criado_em >= inicio) \
+     .group_by(Cliente.id, Cliente.nome, Cliente.telefone) \
+     .order_by(creditos.desc()).limit(limite).all()
+
+    return {
+        "status": "sucesso",
+        "dias": dias,
+        "clientes": [{
+            "cliente_id": cid, "nome": nome, "telefone": telefone, "respostas": respostas,
+            "tokens_prompt": int(prompt or 0), "tokens_resposta": int(resposta or 0),
+            "creditos": int(total or 0)
+        } for cid, nome, telefone, respostas, prompt, resposta, total in linhas]
+    }
+
 TOOLS_MAP = {
     "adicionar_cliente": adicionar_cliente,
     "buscar_informacoes_cliente": buscar_informacoes_cliente,
-    "listar_produtos_ativos": listar_produtos_ativos
+    "listar_produtos_ativos": listar_produtos_ativos,
+    "volume_mensagens": volume_mensagens,
+    "novos_leads": novos_leads,
+    "leads_por_modo": leads_por_modo,
+    "horarios_pico": horarios_pico,
+    "consumo_tokens": consumo_tokens,
+    "custo_por_cliente": custo_por_cliente
 }
 
 # =========================================================
@@ -107,5 +377,15 @@ TOOLS_PERMISSIONS = {
     "buscar_informacoes_cliente": ["admin", "atendente"],
     
     # Listar produtos é permitido para todos
-    "listar_produtos_ativos": ["admin", "atendente"]
+    "listar_produtos_ativos": ["admin", "atendente"],
+
+    # Relatórios de atendimento: todos
+    "volume_mensagens": ["admin", "atendente"],
+    "novos_leads": ["admin", "atendente"],
+    "leads_por_modo": ["admin", "atendente"],
+    "horarios_pico": ["admin", "atendente"],
+
+    # Consumo/saldo de tokens é informação financeira: só Admin
+    "consumo_tokens": ["admin"],
+    "custo_por_cliente": ["admin"]
 }
\ No newline at end of file
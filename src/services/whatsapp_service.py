@@ -0,0 +1,29 @@
+import os
+
+# =========================================================
+# ENVIO VIA TWILIO (import preguiçoso)
+# =========================================================
+# O SDK do Twilio só é importado no primeiro envio. Assim o boot do
+# worker (e o init_db) não paga o custo do import.
+
+# Resposta TwiML vazia (equivalente a str(MessagingResponse()))
+TWIML_VAZIO = '<?xml version="1.0" encoding="UTF-8"?><Response />'
+
+_client = None
+
+def get_twilio_client():
+    """Cria (uma vez por worker) o client do Twilio com as credenciais do .env."""
+    global _client
+    if _client is None:
+        from twilio.rest import Client
+        _client = Client(os.getenv('TWILIO_ACCOUNT_SID'), os.getenv('TWILIO_AUTH_TOKEN'))
+    return _client
+
+def twilio_configurado():
+    return bool(os.getenv('TWILIO_ACCOUNT_SID') and os.getenv('TWILIO_AUTH_TOKEN'))
+
+def enviar_mensagem(texto, destino):
+    """Envia mensagem ativa pelo WhatsApp. Retorna o objeto Message do Twilio."""
+    # O numero do .env TEM QUE TER 'whatsapp:'
+    from_number = os.getenv('TWILIO_PHONE_NUMBER')
+    return get_twilio_client().messages.create(body=texto, from_=from_number, to=destino)